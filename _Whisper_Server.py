@@ -1,4 +1,6 @@
 # Whisper_Server.py 
+from typing import List
+
 from fastapi import FastAPI, File, UploadFile
 from fastapi.responses import JSONResponse
 from faster_whisper import WhisperModel
@@ -7,30 +9,41 @@ import tempfile, os
 app = FastAPI()
 
 # モデルをあらかじめロード
-model = WhisperModel("small", device="cpu", compute_type="int8")
+# cpu_threadsは環境変数で調整可能（デフォルト: 物理コアの半分目安）
+model = WhisperModel(
+    "small", device="cpu", compute_type="int8",
+    cpu_threads=int(os.getenv("WHISPER_CPU_THREADS", max(1, (os.cpu_count() or 2) // 2))),
+)
 
 @app.post("/transcribe")
-async def transcribe(file: UploadFile = File(...)):
-    # 一時ファイルに保存
-    tmp_path = tempfile.mktemp(suffix=".wav")
-    with open(tmp_path, "wb") as f:
-        f.write(await file.read())
-
-    # 文字起こし（1回だけ呼ぶ）
-    segments, info = model.transcribe(tmp_path, vad_filter=True, beam_size=1)
-    segments = list(segments)  # ★ここでジェネレーターをリスト化
-
-    text = "".join([seg.text for seg in segments])
-    seg_list = [
-        {"id": i, "start": seg.start, "end": seg.end, "text": seg.text}
-        for i, seg in enumerate(segments)
-    ]
-
+async def transcribe(file: List[UploadFile] = File(...)):
+    # fileパートの繰り返し（クライアントのバッチ送信）をまとめて受ける。
+    # 従来どおり1パートだけでも要素1のリストになるので互換
+    texts = []
+    seg_list = []
+    language = None
+    for up in file:
+        # 一時ファイルに保存
+        tmp_path = tempfile.mktemp(suffix=".wav")
+        with open(tmp_path, "wb") as f:
+            f.write(await up.read())
+
+        # 文字起こし（1回だけ呼ぶ）
+        segments, info = model.transcribe(tmp_path, vad_filter=True, beam_size=1)
+        segments = list(segments)  # ★ここでジェネレーターをリスト化
+
+        os.remove(tmp_path)
+        if language is None:
+            language = info.language
+        texts.append("".join([seg.text for seg in segments]))
+        for seg in segments:
+            seg_list.append(
+                {"id": len(seg_list), "start": seg.start, "end": seg.end, "text": seg.text}
+            )
 
-    os.remove(tmp_path)
     return JSONResponse(content={
-        "language": info.language,
-        "text": text,
+        "language": language,
+        "text": "".join(texts),
         "segments": seg_list
     })
 
@@ -2,10 +2,16 @@
 import os
 import asyncio
 import tempfile
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import FastAPI, File, UploadFile, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+# orjson があればJSONシリアライズをC実装に差し替える（長い日本語transcriptで効く）
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as JSONResponse
+except ImportError:
+    from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
@@ -16,6 +22,9 @@ sem = asyncio.Semaphore(1)      # 同時実行を制限（CPU版は1~2推奨）
 
 app = FastAPI()
 
+# JSONレスポンス（日本語の文字起こし結果）はgzipでよく縮む
+app.add_middleware(GZipMiddleware, minimum_size=512)
+
 # 静的/テンプレート（ディレクトリが存在することを確認）
 if os.path.isdir("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -70,38 +79,48 @@ async def _save_upload_to_temp(upload: UploadFile) -> str:
     return path
 
 @app.post("/transcribe")
-async def transcribe(file: UploadFile = File(...)):
+async def transcribe(file: List[UploadFile] = File(...)):
     if not file:
         raise HTTPException(status_code=400, detail="file がありません")
     if not model_ready:
         # 起動直後はまだロード中の可能性
         raise HTTPException(status_code=503, detail="model is loading")
 
-    tmp_path = await _save_upload_to_temp(file)
-    try:
-        async with sem:  # 同時実行を制限
-            # CPUだとVAD有りは少し重い。必要に応じてfalse/beam_size調整
-            segments, info = await asyncio.to_thread(
-                model.transcribe,
-                tmp_path,
-                vad_filter=True,
-                beam_size=1,
-                language="ja"
+    # fileパートの繰り返し（step3クライアントのバッチ送信）をまとめて受ける。
+    # スカラーUploadFileのままだと複数パートでも1個だけ黙って処理されてしまう。
+    # 従来どおり1パートだけでも要素1のリストになるので互換
+    texts = []
+    seg_list = []
+    language = None
+    for up in file:
+        tmp_path = await _save_upload_to_temp(up)
+        try:
+            async with sem:  # 同時実行を制限
+                # CPUだとVAD有りは少し重い。必要に応じてfalse/beam_size調整
+                segments, info = await asyncio.to_thread(
+                    model.transcribe,
+                    tmp_path,
+                    vad_filter=True,
+                    beam_size=1,
+                    language="ja"
+                )
+            segments = list(segments)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if language is None:
+            language = info.language
+        texts.append("".join(seg.text for seg in segments))
+        for seg in segments:
+            seg_list.append(
+                {"id": len(seg_list), "start": seg.start, "end": seg.end, "text": seg.text}
             )
-        segments = list(segments)
-        text = "".join(seg.text for seg in segments)
-        seg_list = [
-            {"id": i, "start": seg.start, "end": seg.end, "text": seg.text}
-            for i, seg in enumerate(segments)
-        ]
-        return JSONResponse(content={
-            "language": info.language,
-            "text": text,
-            "segments": seg_list
-        })
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+
+    return JSONResponse(content={
+        "language": language,
+        "text": "".join(texts),
+        "segments": seg_list
+    })
 
 @app.post("/transcribe_long")
 async def transcribe_long(file: UploadFile = File(...)):
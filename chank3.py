@@ -4,13 +4,19 @@ from tkinter import ttk, scrolledtext, messagebox
 import sounddevice as sd
 import soundfile as sf
 import numpy as np
-import threading, queue, time
+import io
+import os
+import functools
+import collections
+import threading, queue, time, math
 from pathlib import Path
-import datetime as dt
 
 # ==== 設定 ====
 CHUNK_SECONDS = 3.0
 OVERLAP_SECONDS = 0.5
+# 無音チャンクはモデルに投げないための簡易エネルギーゲート（マイクに合わせて調整）
+ENERGY_RMS_GATE = 1e-4
+ENERGY_PEAK_GATE = 1e-3
 OUTDIR = Path.cwd() / "live_sessions"
 OUTDIR.mkdir(exist_ok=True)
 
@@ -19,12 +25,33 @@ try:
 except ImportError:
     WhisperModel = None  # エラーメッセージで案内する
 
+try:
+    from faster_whisper import BatchedInferencePipeline
+except ImportError:
+    BatchedInferencePipeline = None  # 古いfaster-whisperでは逐次処理のまま
+
+try:
+    from scipy.signal import resample_poly
+except ImportError:
+    resample_poly = None  # 無ければ一時WAV経由にフォールバック
+
 # ==== ユーティリティ ====
-def now_tag():
-    return dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+def to_16k(audio, sr):
+    """float32配列を16kHzへ変換して返す。変換できない場合はNone。"""
+    if sr == 16000:
+        return audio
+    if resample_poly is None:
+        return None
+    g = math.gcd(16000, int(sr))
+    return resample_poly(audio, 16000 // g, int(sr) // g).astype(np.float32)
+
+@functools.lru_cache(maxsize=1)
+def _cached_devices():
+    # PortAudioのデバイス列挙はブロッキングで遅い（特にWindows）ので一度だけ
+    return sd.query_devices(), sd.query_hostapis()
 
 def list_input_devices():
-    devs = sd.query_devices(); apis = sd.query_hostapis()
+    devs, apis = _cached_devices()
     out = []
     for i, d in enumerate(devs):
         if d.get("max_input_channels", 0) >= 1:
@@ -37,10 +64,10 @@ def list_input_devices():
             })
     return out
 
-def try_open(device_index, sr, seconds=0.15):
+def try_open(device_index, sr):
+    # ストリームを実際に開いて0.15秒待つ代わりに設定チェックだけで判定する
     try:
-        s = sd.InputStream(device=device_index, samplerate=int(sr), channels=1, dtype="float32", blocksize=0)
-        s.start(); time.sleep(seconds); s.stop(); s.close()
+        sd.check_input_settings(device=device_index, samplerate=int(sr), channels=1, dtype="int16")
         return True, ""
     except Exception as e:
         return False, str(e)
@@ -64,53 +91,96 @@ def auto_pick_device_and_sr(devices):
     return None, None, "どのデバイス/サンプルレートでも開けませんでした"
 
 # ==== チャンクャ ====
+def _ring_write(ring, w, x):
+    # リングへの書き込み本体（折り返しは2スライス代入で吸収）
+    cap = ring.shape[0]
+    n = x.shape[0]
+    i = w % cap
+    first = min(n, cap - i)
+    ring[i:i + first] = x[:first]
+    if n > first:
+        ring[:n - first] = x[first:]
+
+try:
+    # numbaがあればRTコールバックのホットパスをネイティブ化（GILも解放）
+    from numba import njit
+    _ring_write = njit(cache=True, nogil=True)(_ring_write)
+except ImportError:
+    pass
+
 class Chunker:
-    def __init__(self, sr, chunk_s, overlap_s):
+    def __init__(self, sr, chunk_s, overlap_s, max_block=8192):
         self.sr = sr
         self.chunk_n = int(round(chunk_s * sr))
         self.overlap_n = int(round(overlap_s * sr))
-        self.buf = np.zeros((0, 1), dtype=np.float32)
-        self.emitted = 0
-        self.out_q = queue.Queue(maxsize=8)
+        self._inv_sr = 1.0 / sr  # 排出時の秒換算用（毎回の除算をやめる）
+        self._flush_thresh_n = int(0.8 * sr)
+        # 固定長リングバッファ（毎フィードのconcatenate再確保をやめる）
+        # 容量 = 1チャンク + overlap文脈 + コールバック1ブロック分の余裕
+        # int16で持つ（float32比でメモリ帯域・コピー量が半分。float化は推論直前に1回だけ）
+        self.cap = self.chunk_n + self.overlap_n + max_block
+        self.ring = np.zeros(self.cap, dtype=np.int16)
+        self.w = 0   # 書き込み済み累計サンプル数
+        self.r = 0   # チャンクとして排出済み累計サンプル数
+        # 単一生産者/単一消費者なのでロック付きQueueではなくdeque+Eventで渡す
+        # (maxlen超過は古いチャンクから自動で落ちる＝従来のドロップ挙動と同じ)
+        self.out_q = collections.deque(maxlen=8)
+        self.ready = threading.Event()
+        # numba採用時の初回JITコンパイル（数百ms）をRTコールバックの外で
+        # 済ませておく。feedは2-D入力の列ビューを渡すので、連続/ストライド
+        # 両レイアウトのシグネチャを先に作る
+        dummy = np.zeros((2, 2), dtype=self.ring.dtype)
+        _ring_write(self.ring, 0, dummy[0])
+        _ring_write(self.ring, 0, dummy[:, 0])
+
+    def _write(self, x):
+        _ring_write(self.ring, self.w, x)
+        self.w += x.shape[0]
+
+    def _copy_out(self, start, end):
+        # 累計サンプル位置 [start, end) を取り出す（start<0の分はゼロ埋め）
+        out = np.zeros(end - start, dtype=np.int16)
+        lo = max(start, 0)
+        pos = lo - start
+        i = lo % self.cap
+        n = end - lo
+        first = min(n, self.cap - i)
+        out[pos:pos + first] = self.ring[i:i + first]
+        if n > first:
+            out[pos + first:] = self.ring[:n - first]
+        return out
+
+    def _emit(self, end):
+        # 直前のoverlap_nサンプルを文脈として先頭に付けて排出
+        audio = self._copy_out(self.r - self.overlap_n, end)
+        s = self.r * self._inv_sr
+        e = end * self._inv_sr
+        self.r = end
+        self.out_q.append((s, e, audio))
 
     def feed(self, data):
-        if data.ndim == 1:
-            data = data[:, None]
-        elif data.ndim == 2 and data.shape[1] > 1:
-            data = data[:, :1]
-        self.buf = np.concatenate([self.buf, data], axis=0)
-        while self.buf.shape[0] >= self.chunk_n:
-            chunk = self.buf[: self.chunk_n]
-            self.buf = self.buf[self.chunk_n :]
-            prefix = self._tail()
-            audio = np.concatenate([prefix, chunk], axis=0)[:, 0].astype(np.float32)
-            s = self.emitted / float(self.sr)
-            e = (self.emitted + self.chunk_n) / float(self.sr)
-            self.emitted += self.chunk_n
-            if self.out_q.full():
-                try: self.out_q.get_nowait()
-                except queue.Empty: pass
-            self.out_q.put((s, e, audio))
+        # RTコールバックから呼ぶ：リングへの書き込みと通知のみ（排出は_consumer側で）
+        if data.ndim == 2:
+            data = data[:, 0]
+        self._write(data)
+        self.ready.set()
+
+    def emit_ready(self):
+        # 溜まった分を1チャンクずつ排出する（コンシューマスレッドから呼ぶ）
+        # リング容量は約1.2チャンク分なので、複数チャンクを1スパンでまとめて
+        # コピーすると容量を超える（周回済みの別時刻サンプルが混ざる）
+        while self.w - self.r >= self.chunk_n:
+            if self.w - self.r > self.cap - self.overlap_n:
+                # コンシューマが遅れてリングを周回された：上書き済み区間は
+                # コピーせず読み飛ばして追いつく
+                skipped = self.w - self.chunk_n - self.r
+                self.r += skipped
+                print(f"Chunker: 処理が追いつかず {skipped * self._inv_sr:.2f}s 分を破棄")
+            self._emit(self.r + self.chunk_n)
 
     def flush(self):
-        if self.buf.shape[0] > int(0.8 * self.sr):
-            chunk = self.buf; self.buf = np.zeros((0, 1), dtype=np.float32)
-            prefix = self._tail()
-            audio = np.concatenate([prefix, chunk], axis=0)[:, 0].astype(np.float32)
-            s = self.emitted / float(self.sr)
-            e = (self.emitted + chunk.shape[0]) / float(self.sr)
-            self.emitted += chunk.shape[0]
-            if self.out_q.full():
-                try: self.out_q.get_nowait()
-                except queue.Empty: pass
-            self.out_q.put((s, e, audio))
-
-    def _tail(self):
-        tail = np.zeros((self.overlap_n, 1), dtype=np.float32)
-        take = min(self.overlap_n, self.buf.shape[0])
-        if take > 0:
-            tail[-take:] = self.buf[:take]
-        return tail
+        if self.w - self.r > self._flush_thresh_n:
+            self._emit(self.w)
 
 # ==== アプリ ====
 class App(tk.Tk):
@@ -127,15 +197,32 @@ class App(tk.Tk):
         self.chunker = None
         self.run_ev = threading.Event()
         self.last_chunk = None
-        self.q_jobs = queue.Queue()
+        # put/getで毎回ロック+Conditionを取らないC実装キュー（深さ制限はqsize側で担保）
+        self.q_jobs = queue.SimpleQueue()
         self._last_auto_sent_s = None
+        self.detected_lang = None  # 初回チャンクで判定した言語をキャッシュ
 
         # モデル
         if WhisperModel is None:
             messagebox.showerror("faster-whisper が未インストール",
                                  "pip install faster-whisper を実行してください。")
             self.destroy(); return
-        self.model = WhisperModel("small", device="cpu", compute_type="int8")
+        # GPUがあればfloat16、CPUならint8 + スレッド数調整（WHISPER_DEVICEで強制可）
+        device = os.getenv("WHISPER_DEVICE")
+        if device is None:
+            try:
+                import ctranslate2
+                device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+            except Exception:
+                device = "cpu"
+        if device == "cuda":
+            self.model = WhisperModel("small", device="cuda", compute_type="float16")
+        else:
+            self.model = WhisperModel(
+                "small", device="cpu", compute_type="int8",
+                cpu_threads=max(1, (os.cpu_count() or 2) // 2), num_workers=2)
+        # 溜まったチャンクをまとめて1回で推論するためのパイプライン（対応版のみ）
+        self.batched_model = BatchedInferencePipeline(model=self.model) if BatchedInferencePipeline else None
 
         self._build_ui()
         self._start_worker()
@@ -156,8 +243,11 @@ class App(tk.Tk):
         self.btn_send  = ttk.Button(ctrl, text="📤 Send last chunk", command=self.send_last, state=tk.DISABLED)
         self.autosend  = tk.BooleanVar(value=False)
         chk = ttk.Checkbutton(ctrl, text="Auto-send every chunk", variable=self.autosend)
+        self.lock_lang = tk.BooleanVar(value=True)
+        chk_lang = ttk.Checkbutton(ctrl, text="Lock language", variable=self.lock_lang)
         self.btn_start.pack(side=tk.LEFT); self.btn_stop.pack(side=tk.LEFT, padx=6)
         self.btn_send.pack(side=tk.LEFT, padx=6); chk.pack(side=tk.RIGHT)
+        chk_lang.pack(side=tk.RIGHT, padx=6)
 
         self.txt = scrolledtext.ScrolledText(self, wrap=tk.WORD, height=18)
         self.txt.pack(fill=tk.BOTH, expand=True, padx=10, pady=8)
@@ -187,7 +277,7 @@ class App(tk.Tk):
             else:
                 messagebox.showerror("Test", "デバイス未選択"); return
         else:
-            sr = self.sr or int(round(sd.query_devices()[idx].get("default_samplerate", 16000)))
+            sr = self.sr or int(round(_cached_devices()[0][idx].get("default_samplerate", 16000)))
         ok, err = try_open(idx, sr)
         if ok: messagebox.showinfo("Test", f"Open OK (device={idx}, sr={sr})")
         else:  messagebox.showerror("Test", f"Open failed: {err}")
@@ -196,7 +286,8 @@ class App(tk.Tk):
     def _cb(self, indata, frames, time_info, status_):
         if status_:
             print("PortAudio:", status_)
-        self.chunker.feed(indata.copy())
+        # feedはコールバック内でリングへコピーし終えるので indata.copy() は不要
+        self.chunker.feed(indata)
 
     def start_live(self):
         if not self.devices:
@@ -211,9 +302,10 @@ class App(tk.Tk):
         self.chunker = Chunker(self.sr, CHUNK_SECONDS, OVERLAP_SECONDS)
         sd.default.device = (self.device_index, None)
         try:
+            # int16のまま取り込む（PortAudio内部のfloat変換とバッファ半減）
             self.stream = sd.InputStream(device=self.device_index, samplerate=self.sr,
-                                         channels=1, dtype="float32",
-                                         blocksize=0, latency="high", callback=self._cb)
+                                         channels=1, dtype="int16",
+                                         blocksize=1024, latency="low", callback=self._cb)
             self.stream.start()
         except Exception as e:
             messagebox.showerror("Start", f"InputStream失敗: {e}"); return
@@ -227,33 +319,49 @@ class App(tk.Tk):
 
     def _consumer(self):
         while self.run_ev.is_set():
-            # 生成済みチャンクをすべて取り出す
-            while not self.chunker.out_q.empty():
+            # コールバックからの書き込み通知を待つ（futex待ちなので待機中CPUゼロ）
+            if not self.chunker.ready.wait(timeout=0.25):
+                continue
+            self.chunker.ready.clear()
+            # チャンク組み立てはRTスレッドではなくここでやる
+            self.chunker.emit_ready()
+            while True:
                 try:
-                    s, e, audio = self.chunker.out_q.get_nowait()
-                except queue.Empty:
+                    s, e, audio = self.chunker.out_q.popleft()
+                except IndexError:
                     break
                 self.last_chunk = (s, e, audio)
                 # Auto-send
                 if self.autosend.get():
+                    # 無音チャンクはWhisperを呼ばずに捨てる（無音での幻聴対策にもなる）
+                    # int16同士のdotは桁あふれするのでゲート判定だけfloat32に直す
+                    xf = audio.astype(np.float32) * (1.0 / 32768.0)
+                    rms = math.sqrt(float(np.dot(xf, xf)) / max(xf.size, 1))
+                    peak = float(np.max(np.abs(xf))) if xf.size else 0.0
+                    if rms < ENERGY_RMS_GATE and peak < ENERGY_PEAK_GATE:
+                        continue
                     # 連投しすぎ防止：同じ開始時刻はスキップ
                     if self._last_auto_sent_s != s and self.q_jobs.qsize() < 3:
                         self.q_jobs.put(("transcribe_local", (s, e, audio, self.sr)))
                         self._last_auto_sent_s = s
-            time.sleep(0.03)
         # stop時 flush
+        self.chunker.emit_ready()
         self.chunker.flush()
-        while not self.chunker.out_q.empty():
-            try: self.last_chunk = self.chunker.out_q.get_nowait()
-            except queue.Empty: break
+        while True:
+            try: self.last_chunk = self.chunker.out_q.popleft()
+            except IndexError: break
 
     def stop_live(self):
-        self.run_ev.clear()
+        # 先にストリームを止めてリングへの書き込みを確定させ、そのうえで
+        # _consumerを起こす（最終のemit/flushと書き込みが競合しない）
         try:
             if self.stream: self.stream.stop(); self.stream.close()
         except Exception:
             pass
         self.stream = None
+        self.run_ev.clear()
+        if self.chunker:
+            self.chunker.ready.set()  # 待機中の_consumerを起こして終了処理へ
         self.status.set("Stopped")
         self.btn_start.config(state=tk.NORMAL)
         self.btn_stop.config(state=tk.DISABLED)
@@ -261,21 +369,60 @@ class App(tk.Tk):
     # ==== 送信（ローカル推論） ====
     def _start_worker(self):
         def worker():
+            # 推論スレッドをコア0以外に寄せて、音声コールバック/UI側の
+            # スケジューリング遅延（＝取りこぼし）を減らす（Linux限定、失敗は無視）
+            if hasattr(os, "sched_setaffinity") and (os.cpu_count() or 1) > 1:
+                try:
+                    os.sched_setaffinity(0, set(range(1, os.cpu_count())))
+                except OSError:
+                    pass
             while True:
                 kind, payload = self.q_jobs.get()
                 if kind == "transcribe_local":
-                    s, e, audio, sr = payload
-                    # 一時WAVに書いてから faster-whisper に渡す（SR差も吸収）
-                    tmp = OUTDIR / f"tmp_{now_tag()}.wav"
+                    # Auto-sendで溜まった後続チャンクも取り出してまとめて推論する
+                    jobs = [payload]
+                    while len(jobs) < 8:
+                        try:
+                            _, payload2 = self.q_jobs.get(timeout=0.05)
+                        except queue.Empty:
+                            break
+                        jobs.append(payload2)
+                    s = jobs[0][0]
+                    e = jobs[-1][1]
+                    sr = jobs[0][3]
+                    audio_i16 = jobs[0][2] if len(jobs) == 1 else np.concatenate([j[2] for j in jobs])
+                    # リアルタイム途中結果はgreedyで十分（beam=5は約5倍のデコード計算）
+                    # タイムスタンプも表示に使わないので省略する
+                    kw = dict(beam_size=1, best_of=1,
+                              condition_on_previous_text=False,
+                              without_timestamps=True)
+                    if self.lock_lang.get() and self.detected_lang:
+                        # 2チャンク目以降は毎回の言語判定（エンコーダ1パス分）を省く
+                        kw["language"] = self.detected_lang
                     try:
-                        sf.write(tmp, audio, sr, subtype="PCM_16")
-                        segs, info = self.model.transcribe(str(tmp), beam_size=5)
+                        # float化は推論直前のここで1回だけ
+                        audio16k = to_16k(audio_i16.astype(np.float32) * (1.0 / 32768.0), sr)
+                        if audio16k is not None and self.batched_model is not None and len(jobs) > 1:
+                            # まとめた分はBatchedInferencePipelineで一括処理
+                            segs, info = self.batched_model.transcribe(
+                                audio16k, batch_size=8, beam_size=1,
+                                language=kw.get("language"),
+                                without_timestamps=True)
+                        elif audio16k is not None:
+                            # float32配列を直接渡す（WAV書き出し→再デコードを省く）
+                            segs, info = self.model.transcribe(audio16k, **kw)
+                        else:
+                            # scipyが無い環境はWAV経由（SR差を吸収）。ただしファイルは
+                            # 作らずメモリ上のBytesIOをそのまま渡す（int16はPCM_16で無変換）
+                            buf = io.BytesIO()
+                            sf.write(buf, audio_i16, sr, format="WAV", subtype="PCM_16")
+                            buf.seek(0)
+                            segs, info = self.model.transcribe(buf, **kw)
+                        if self.detected_lang is None:
+                            self.detected_lang = info.language
                         text = "".join(seg.text for seg in segs).strip() or "(no speech detected)"
                     except Exception as ex:
                         text = f"(error: {ex})"
-                    finally:
-                        try: tmp.unlink(missing_ok=True)
-                        except Exception: pass
                     self._append_text(s, e, text)
         threading.Thread(target=worker, daemon=True, name="TranscribeWorker").start()
 
@@ -7,7 +7,7 @@ import subprocess
 from typing import Optional, List
 
 from fastapi import FastAPI, File, UploadFile, Query, HTTPException, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 
 # ---- 許可する入力拡張子／出力フォーマット ----
@@ -16,6 +16,10 @@ ALLOWED_INPUT_EXTS = {
 }
 ALLOWED_OUTPUT_FMTS = {"mp3", "wav", "flac", "ogg", "opus", "m4a"}
 
+# pipe:1 へ出力する時の -f 指定（拡張子が無いので明示が必要）
+# m4a(MP4コンテナ)はシーク可能な出力が必要なため一時ファイル経由のまま
+PIPE_OUTPUT_MUXERS = {"mp3": "mp3", "wav": "wav", "flac": "flac", "ogg": "ogg", "opus": "ogg"}
+
 # ---- テンプレート設定 ----
 templates = Jinja2Templates(directory="templates") if os.path.isdir("templates") else None
 
@@ -43,17 +47,43 @@ async def health():
 
 
 # ---- アップロードを一時保存 ----
+def _sendfile_to(src: UploadFile, dst) -> bool:
+    # 大きいアップロードは実ファイルにスプールされているので、可能なら
+    # sendfileでカーネル内コピーする（バイト列をユーザー空間に通さない）
+    if not hasattr(os, "sendfile"):
+        return False
+    try:
+        src_fd = src.file.fileno()
+    except Exception:
+        return False  # メモリ上のスプール等
+    dst_fd = dst.fileno()
+    try:
+        os.lseek(src_fd, 0, os.SEEK_SET)
+        while True:
+            sent = os.sendfile(dst_fd, src_fd, None, 16 * 1024 * 1024)
+            if sent == 0:
+                return True
+    except OSError:
+        # 途中失敗分を巻き戻してread/writeコピーにフォールバック
+        os.ftruncate(dst_fd, 0)
+        os.lseek(dst_fd, 0, os.SEEK_SET)
+        return False
+
+
 async def _save_to_temp(src: UploadFile) -> str:
     _, ext = os.path.splitext(src.filename or "")
     ext = ext.lower() if ext else ".bin"
     fd, path = tempfile.mkstemp(suffix=ext)
     try:
         with os.fdopen(fd, "wb") as f:
-            while True:
-                chunk = await src.read(1024 * 1024)  # 1MBずつ
-                if not chunk:
-                    break
-                f.write(chunk)
+            if not await asyncio.to_thread(_sendfile_to, src, f):
+                await src.seek(0)
+                while True:
+                    chunk = await src.read(4 * 1024 * 1024)  # 4MBずつ
+                    if not chunk:
+                        break
+                    # 同期writeでイベントループを止めない（他の/convertを待たせない）
+                    await asyncio.to_thread(f.write, chunk)
     except Exception:
         try:
             os.remove(path)
@@ -66,7 +96,7 @@ async def _save_to_temp(src: UploadFile) -> str:
 
 
 # ---- ffmpeg コマンドを組み立て ----
-def _build_ffmpeg_cmd(input_path, output_path, out_fmt, ar, ac, ab):
+def _build_ffmpeg_cmd(input_path, output_path, out_fmt, ar, ac, ab, pipe_output=False):
     ffmpeg_bin = "/usr/bin/ffmpeg"   # ← フルパス指定
     args = [ffmpeg_bin, "-hide_banner", "-loglevel", "error", "-y", "-i", input_path]
     
@@ -100,7 +130,10 @@ def _build_ffmpeg_cmd(input_path, output_path, out_fmt, ar, ac, ab):
     else:
         raise HTTPException(status_code=400, detail=f"未対応の出力形式: {out_fmt}")
 
-    args += [output_path]
+    if pipe_output:
+        args += ["-f", PIPE_OUTPUT_MUXERS[out_fmt], "pipe:1"]
+    else:
+        args += [output_path]
     return args
 
 
@@ -121,10 +154,84 @@ async def convert(
     if fmt.lower() not in ALLOWED_OUTPUT_FMTS:
         raise HTTPException(status_code=400, detail=f"対応出力: {sorted(ALLOWED_OUTPUT_FMTS)}")
 
-    # 一時保存
+    fmt = fmt.lower()
+
+    # ダウンロード名
+    if not download_name:
+        base = os.path.splitext(os.path.basename(file.filename or "converted"))[0]
+        download_name = f"{base}.{fmt}"
+    else:
+        base, _ = os.path.splitext(download_name)
+        download_name = f"{base}.{fmt}"
+
+    # Content-Type
+    mime_map = {
+        "mp3": "audio/mpeg",
+        "wav": "audio/wav",
+        "flac": "audio/flac",
+        "ogg": "audio/ogg",
+        "opus": "audio/ogg",  # 容器に依存
+        "m4a": "audio/mp4",
+    }
+    media_type = mime_map.get(fmt, "application/octet-stream")
+
+    # 入力は一時保存（mp4/mov等はシーク可能な入力が必要なのでpipe:0にはしない）
     src_path = await _save_to_temp(file)
-    out_path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4().hex}.{fmt.lower()}")
 
+    if fmt in PIPE_OUTPUT_MUXERS:
+        # 出力一時ファイルを作らず、ffmpegのstdoutをそのままストリーミング返却
+        cmd = _build_ffmpeg_cmd(src_path, None, fmt, ar, ac, ab, pipe_output=True)
+        await sem.acquire()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            # 最初の1ブロックを読んで起動失敗を検出してからレスポンスを返す
+            first = await proc.stdout.read(1024 * 1024)
+            if not first:
+                stderr = await proc.stderr.read()
+                await proc.wait()
+                raise HTTPException(status_code=400, detail=f"変換失敗: {stderr.decode(errors='ignore')[:500]}")
+            # ストリーミング中もstderrを読み捨て続ける。放置するとデコード警告で
+            # パイプ(64KB)が埋まり、ffmpegがstderr書き込みでブロック→stdoutも
+            # 止まってレスポンスがsemを握ったままハングする
+            stderr_task = asyncio.create_task(proc.stderr.read())
+        except Exception:
+            sem.release()
+            try:
+                os.remove(src_path)
+            except Exception:
+                pass
+            raise
+
+        async def _pipe_iter():
+            try:
+                yield first
+                while True:
+                    b = await proc.stdout.read(1024 * 1024)
+                    if not b:
+                        break
+                    yield b
+                await proc.wait()
+            finally:
+                if proc.returncode is None:
+                    try:
+                        proc.kill()
+                    except ProcessLookupError:
+                        pass
+                stderr_task.cancel()
+                sem.release()
+                try:
+                    os.remove(src_path)
+                except Exception:
+                    pass
+
+        resp = StreamingResponse(_pipe_iter(), media_type=media_type)
+        resp.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+        return resp
+
+    # m4aはシーク可能な出力が必要なので従来どおり一時ファイル経由
+    out_path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4().hex}.{fmt}")
     try:
         async with sem:
             cmd = _build_ffmpeg_cmd(src_path, out_path, fmt, ar, ac, ab)
@@ -144,41 +251,13 @@ async def convert(
         except Exception:
             pass
 
-    # ストリーミング返却
-    def _iter():
-        with open(out_path, "rb") as f:
-            while True:
-                b = f.read(1024 * 1024)
-                if not b:
-                    break
-                yield b
-
-    # ダウンロード名
-    if not download_name:
-        base = os.path.splitext(os.path.basename(file.filename or "converted"))[0]
-        download_name = f"{base}.{fmt.lower()}"
-    else:
-        base, _ = os.path.splitext(download_name)
-        download_name = f"{base}.{fmt.lower()}"
-
-    # Content-Type
-    mime_map = {
-        "mp3": "audio/mpeg",
-        "wav": "audio/wav",
-        "flac": "audio/flac",
-        "ogg": "audio/ogg",
-        "opus": "audio/ogg",  # 容器に依存
-        "m4a": "audio/mp4",
-    }
-    media_type = mime_map.get(fmt.lower(), "application/octet-stream")
-
     async def _cleanup():
         try:
             os.remove(out_path)
         except Exception:
             pass
 
+    # FileResponseはsendfileで送る（Pythonのreadループ経由より速く、ループも起こさない）
     from starlette.background import BackgroundTask
-    resp = StreamingResponse(_iter(), media_type=media_type, background=BackgroundTask(_cleanup))
-    resp.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
-    return resp
+    return FileResponse(out_path, media_type=media_type, filename=download_name,
+                        background=BackgroundTask(_cleanup))
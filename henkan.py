@@ -1,8 +1,12 @@
-from pydub import AudioSegment
+import subprocess
 
 mp3_path = r"ohayou.mp3"
 wav_path = r"ohayou.wav"
 
-sound = AudioSegment.from_mp3(mp3_path)
-sound.export(wav_path, format="wav")
+# pydub経由(全サンプルをPython側で持ち直す)をやめてffmpegに直接変換させる
+subprocess.run(
+    ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+     "-i", mp3_path, "-c:a", "pcm_s16le", wav_path],
+    check=True,
+)
 print("変換完了:", wav_path)
@@ -21,9 +21,10 @@ from tkinter import filedialog
 import sounddevice as sd
 import soundfile as sf
 import numpy as np
+import io, math, struct, itertools, collections
 import threading, queue, time, requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
-import datetime as dt
 
 # ====== Config ======
 SERVER_URL_DEFAULT = "http://localhost:8000/transcribe"
@@ -33,17 +34,39 @@ OUTDIR = Path.cwd() / "live_sessions"
 OUTDIR.mkdir(exist_ok=True)
 SAVE_CHUNKS_DIR = OUTDIR / "chunks"
 SAVE_CHUNKS_DIR.mkdir(exist_ok=True)
+# Trueにすると従来どおり各チャンクのWAVをSAVE_CHUNKS_DIRに残す（デバッグ用）
+DEBUG_SAVE = False
 
 # Energy gates (tune for your mic): if both below, treat as silence
 ENERGY_RMS_GATE = 1e-4
 ENERGY_PEAK_GATE = 1e-3
 # Force language (None = server decides). If your server supports it, you can send along.
 FORCE_LANGUAGE = "ja"  # or None
+# 同時に飛ばすPOST数。サーバ応答待ちの裏で次チャンクを送れる（Sessionの接続プール内）
+N_POST_WORKERS = 3
+# 1リクエストに相乗りさせる最大チャンク数と、後続チャンクを待つ時間
+BATCH_MAX_FILES = 3
+BATCH_COALESCE_S = 0.25
+# 文字起こし表示の行数上限（超えたら古い方から刈る）
+MAX_TEXT_LINES = 1000
+# 送信フォーマット。"flac"にすると同じPCMを可逆圧縮して送る
+# （3秒96KB→おおよそ半分。遠隔サーバで帯域が細いときに。サーバ側はffmpegでデコード可）
+POST_FORMAT = "wav"
+POST_MIME = "audio/flac" if POST_FORMAT == "flac" else "audio/wav"
 
 # ====== Utils ======
 
-def now_tag():
-    return dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+def _wav_bytes(audio_i16, sr):
+    # チャンクは常にmono/PCM_16なので44バイトのRIFFヘッダを自前で組み立てる。
+    # libsndfileを通すよりも速く、サンプル列はtobytes（memcpy）だけで済む
+    pcm = audio_i16.tobytes()
+    hdr = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + len(pcm), b"WAVE",
+        b"fmt ", 16, 1, 1, sr, sr * 2, 2, 16,
+        b"data", len(pcm),
+    )
+    return hdr + pcm
 
 
 def list_input_devices():
@@ -90,53 +113,141 @@ def auto_pick_device_and_sr(devices):
 
 
 # ====== Chunker ======
+def _ring_write(ring, w, x):
+    # リングへの書き込み本体（折り返しは2スライス代入で吸収）
+    cap = ring.shape[0]
+    n = x.shape[0]
+    i = w % cap
+    first = min(n, cap - i)
+    ring[i:i + first] = x[:first]
+    if n > first:
+        ring[:n - first] = x[first:]
+
+try:
+    # numbaがあればRTコールバックのホットパスをネイティブ化（GILも解放）
+    from numba import njit
+    _ring_write = njit(cache=True, nogil=True)(_ring_write)
+
+    @njit(cache=True, nogil=True, fastmath=True)
+    def _f32_to_i16(src, dst):
+        # 乗算+飽和+castを1パスで行う（LLVMがSIMDのpacked変換に落とす）
+        for i in range(src.shape[0]):
+            v = src[i] * 32767.0
+            if v > 32767.0:
+                v = 32767.0
+            elif v < -32768.0:
+                v = -32768.0
+            dst[i] = np.int16(v)
+except ImportError:
+    _f32_to_i16 = None  # 無ければnumpyのスクラッチ経由で変換する
+
 class Chunker:
-    def __init__(self, sr, chunk_s, overlap_s):
+    def __init__(self, sr, chunk_s, overlap_s, max_block=8192):
         self.sr = sr
         self.chunk_n = int(round(chunk_s * sr))
         self.overlap_n = int(round(overlap_s * sr))
-        self.buf = np.zeros((0, 1), dtype=np.float32)
-        self.emitted = 0
+        self._inv_sr = 1.0 / sr  # 排出時の秒換算用（毎回の除算をやめる）
+        self._flush_thresh_n = int(0.8 * sr)
+        # 固定長リングバッファ（毎フィードのconcatenate再確保をやめる）
+        # 容量 = 1チャンク + overlap文脈 + コールバック1ブロック分の余裕
+        # POST本体はどうせPCM_16なので、リングもキュー上のチャンクもint16で持つ
+        # （float32比で半分のメモリ/帯域、sf.writeの量子化パスも不要になる）
+        self.cap = self.chunk_n + self.overlap_n + max_block
+        self.ring = np.zeros(self.cap, dtype=np.int16)
+        self.w = 0   # 書き込み済み累計サンプル数
+        self.r = 0   # チャンクとして排出済み累計サンプル数
         self.out_q = queue.Queue(maxsize=8)
+        self.ready = threading.Event()  # コールバック→コンシューマの起床通知
+        # float32→int16変換用スクラッチ（コールバック毎の一時配列確保をやめる）
+        self._f32_scratch = np.empty(max_block, dtype=np.float32)
+        self._i16_scratch = np.empty(max_block, dtype=np.int16)
+        # numba採用時の初回JITコンパイル（数百ms）をRTコールバックの外で
+        # 済ませておく。_quantizeには2-D入力の列ビューも来るので、連続/
+        # ストライド両レイアウトのシグネチャを先に作る
+        dummy = np.zeros((2, 2), dtype=np.float32)
+        if _f32_to_i16 is not None:
+            _f32_to_i16(dummy[0], self._i16_scratch[:2])
+            _f32_to_i16(dummy[:, 0], self._i16_scratch[:2])
+        _ring_write(self.ring, 0, np.zeros(2, dtype=self.ring.dtype))
+
+    def _write(self, x):
+        _ring_write(self.ring, self.w, x)
+        self.w += x.shape[0]
+
+    def _quantize(self, data):
+        # 乗算→clip→castをスクラッチ上でin-placeに行う（素直に書くと
+        # float32の一時配列が3本できる帯域律速のパス）
+        n = data.shape[0]
+        if n > self._i16_scratch.shape[0]:
+            # 想定外の巨大ブロックだけ従来どおり確保して処理
+            return np.clip(data * 32767.0, -32768.0, 32767.0).astype(np.int16)
+        i16 = self._i16_scratch[:n]
+        if _f32_to_i16 is not None:
+            _f32_to_i16(data, i16)
+            return i16
+        f32 = self._f32_scratch[:n]
+        np.multiply(data, 32767.0, out=f32)
+        np.clip(f32, -32768.0, 32767.0, out=f32)
+        np.copyto(i16, f32, casting="unsafe")
+        return i16
+
+    def _copy_out(self, start, end):
+        # 累計サンプル位置 [start, end) を取り出す（start<0の分はゼロ埋め）
+        out = np.zeros(end - start, dtype=np.int16)
+        lo = max(start, 0)
+        pos = lo - start
+        i = lo % self.cap
+        n = end - lo
+        first = min(n, self.cap - i)
+        out[pos:pos + first] = self.ring[i:i + first]
+        if n > first:
+            out[pos + first:] = self.ring[:n - first]
+        return out
+
+    def _put(self, item):
+        # 満杯なら一番古いチャンクを落とす（従来のドロップ挙動と同じ）
+        if self.out_q.full():
+            try: self.out_q.get_nowait()
+            except queue.Empty: pass
+        self.out_q.put(item)
+
+    def _emit(self, end):
+        # 直前のoverlap_nサンプルを文脈として先頭に付けて排出
+        audio = self._copy_out(self.r - self.overlap_n, end)
+        # コピー直後でキャッシュに乗っているうちにエネルギーも計算しておく
+        # (int16同士のdotは桁あふれするのでfloat32に1回だけ直す。ゲート値は
+        #  フルスケール1.0基準のままにしておく)
+        xf = audio.astype(np.float32)
+        rms = math.sqrt(float(np.dot(xf, xf)) / max(xf.size, 1)) * (1.0 / 32768.0)
+        peak = float(np.max(np.abs(xf))) * (1.0 / 32768.0) if xf.size else 0.0
+        s = self.r * self._inv_sr
+        e = end * self._inv_sr
+        self.r = end
+        self._put((s, e, audio, rms, peak))
 
     def feed(self, data):
-        if data.ndim == 1:
-            data = data[:, None]
-        elif data.ndim == 2 and data.shape[1] > 1:
-            data = data[:, :1]
-        self.buf = np.concatenate([self.buf, data], axis=0)
-        while self.buf.shape[0] >= self.chunk_n:
-            chunk = self.buf[: self.chunk_n]
-            self.buf = self.buf[self.chunk_n :]
-            prefix = self._tail()
-            audio = np.concatenate([prefix, chunk], axis=0)[:, 0].astype(np.float32)
-            s = self.emitted / float(self.sr)
-            e = (self.emitted + self.chunk_n) / float(self.sr)
-            self.emitted += self.chunk_n
-            if self.out_q.full():
-                try: self.out_q.get_nowait()
-                except queue.Empty: pass
-            self.out_q.put((s, e, audio))
+        # RTコールバックから呼ぶ：リングへの書き込みのみ（排出は_consumer側で）
+        if data.ndim == 2:
+            # 多チャンネルは平均でダウンミックス（ch0だけ使うよりSNRが良い）
+            data = data[:, 0] if data.shape[1] == 1 else data.mean(axis=1, dtype=np.float32)
+        # float32→int16はここで1回だけ（以降のパイプラインは全てint16）
+        self._write(self._quantize(data))
+        self.ready.set()
+
+    def emit_ready(self):
+        # 溜まった分をチャンクとして排出する（コンシューマスレッドから呼ぶ）
+        while self.w - self.r >= self.chunk_n:
+            if self.w - self.r > self.cap - self.overlap_n:
+                # コンシューマが遅れてリングを周回された：上書き済み区間は
+                # コピーせず読み飛ばして追いつく
+                skipped = self.w - self.chunk_n - self.r
+                self.r += skipped
+                print(f"Chunker: 処理が追いつかず {skipped * self._inv_sr:.2f}s 分を破棄")
+            self._emit(self.r + self.chunk_n)
 
     def flush(self):
-        if self.buf.shape[0] > int(0.8 * self.sr):
-            chunk = self.buf; self.buf = np.zeros((0, 1), dtype=np.float32)
-            prefix = self._tail()
-            audio = np.concatenate([prefix, chunk], axis=0)[:, 0].astype(np.float32)
-            s = self.emitted / float(self.sr)
-            e = (self.emitted + chunk.shape[0]) / float(self.sr)
-            self.emitted += chunk.shape[0]
-            if self.out_q.full():
-                try: self.out_q.get_nowait()
-                except queue.Empty: pass
-            self.out_q.put((s, e, audio))
-
-    def _tail(self):
-        tail = np.zeros((self.overlap_n, 1), dtype=np.float32)
-        take = min(self.overlap_n, self.buf.shape[0])
-        if take > 0:
-            tail[-take:] = self.buf[:take]
-        return tail
+        if self.w - self.r > self._flush_thresh_n:
+            self._emit(self.w)
 
 
 # ====== App ======
@@ -148,15 +259,37 @@ class App(tk.Tk):
 
         # State
         self.devices = list_input_devices()
+        # Testボタン等からのsd.query_devices()再列挙を避けるための索引
+        self._dev_by_index = {d["index"]: d for d in self.devices}
         self.device_index = None
         self.sr = None
         self.stream = None
         self.chunker = None
         self.run_ev = threading.Event()
         self.last_chunk = None
-        self.q_jobs = queue.Queue()
+        # put/getで毎回ロック+Conditionを取らないC実装キュー（深さ制限はqsize側で担保）
+        self.q_jobs = queue.SimpleQueue()
         self._last_auto_sent_s = None
         self._last_peak = 0.0
+        # デバッグ保存は最新64個だけ残す巡回ファイル名（ディレクトリが際限なく育たない）
+        self._dbg_idx = itertools.cycle(range(64))
+        self._pending_text = collections.deque()  # ワーカー→UIの表示待ちテキスト
+
+        # 1本のSessionをkeep-aliveで使い回す（POSTごとのTCP接続確立をやめる）
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, pool_block=False)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+        # ピング用WAVは毎クリック生成せず、起動時に1回だけ作ってメモリに持つ
+        ping_sr = 16000
+        self._silent_wav = io.BytesIO()
+        sf.write(self._silent_wav, np.zeros(int(ping_sr * 0.5), dtype=np.float32),
+                 ping_sr, format="WAV", subtype="PCM_16")
+        t = np.arange(int(ping_sr * 1.0)) / ping_sr
+        self._sine_wav = io.BytesIO()
+        sf.write(self._sine_wav, (0.6 * np.sin(2 * np.pi * 440 * t)).astype(np.float32),
+                 ping_sr, format="WAV", subtype="PCM_16")
 
         self._build_ui()
         self._start_worker()
@@ -198,6 +331,7 @@ class App(tk.Tk):
         self.level_bar = ttk.Progressbar(lf, orient="horizontal", length=250, mode="determinate", maximum=1.0, variable=self.level_var)
         self.level_bar.pack(side=tk.LEFT, padx=6)
         self.after(100, self._tick_level)
+        self.after(100, self._drain_text)
 
         self.status = tk.StringVar(value="Ready")
         ttk.Label(self, textvariable=self.status).pack(anchor="w", padx=12, pady=(0,8))
@@ -223,7 +357,8 @@ class App(tk.Tk):
             else:
                 messagebox.showerror("Test", "デバイス未選択"); return
         else:
-            sr = self.sr or int(round(sd.query_devices()[idx].get("default_samplerate", 16000)))
+            d = self._dev_by_index.get(idx, {})
+            sr = self.sr or int(round(d.get("default_sr") or 16000))
         ok, err = try_open(idx, sr)
         if ok: messagebox.showinfo("Test", f"Open OK (device={idx}, sr={sr})")
         else:  messagebox.showerror("Test", f"Open failed: {err}")
@@ -232,9 +367,12 @@ class App(tk.Tk):
     def _cb(self, indata, frames, time_info, status_):
         if status_:
             print("PortAudio:", status_)
-        peak = float(np.max(np.abs(indata))) if indata.size else 0.0
+        # abs配列を作らず2回のリダクションでピークを取る（RTスレッドで毎回の
+        # 一時配列確保をやめる）
+        peak = max(float(indata.max()), -float(indata.min())) if indata.size else 0.0
         self._last_peak = 0.8*self._last_peak + 0.2*peak
-        self.chunker.feed(indata.copy())
+        # feedはコールバック内でリングへコピーし終えるので indata.copy() は不要
+        self.chunker.feed(indata)
 
     def start_live(self):
         if not self.devices:
@@ -247,9 +385,11 @@ class App(tk.Tk):
         self.chunker = Chunker(self.sr, CHUNK_SECONDS, OVERLAP_SECONDS)
         sd.default.device = (self.device_index, None)
         try:
+            # 固定の小ブロック＋低レイテンシ設定（可変長ブロックをやめて
+            # コールバック周期とリング書き込みサイズを一定にする）
             self.stream = sd.InputStream(device=self.device_index, samplerate=self.sr,
-                                         channels=1, dtype="float32", blocksize=0,
-                                         latency="high", callback=self._cb)
+                                         channels=1, dtype="float32", blocksize=512,
+                                         latency="low", callback=self._cb)
             self.stream.start()
         except Exception as e:
             messagebox.showerror("Start", f"InputStream失敗: {e}"); return
@@ -262,95 +402,156 @@ class App(tk.Tk):
 
     def _consumer(self):
         while self.run_ev.is_set():
-            while not self.chunker.out_q.empty():
+            # 書き込み通知を待つ（sleepポーリングをやめてチャンク完成直後に起きる）
+            if not self.chunker.ready.wait(timeout=0.25):
+                continue
+            self.chunker.ready.clear()
+            # チャンク組み立てはRTスレッドではなくここでやる
+            self.chunker.emit_ready()
+            # empty()を先に見る二重チェックはやめてEmpty例外だけで抜ける
+            while True:
                 try:
-                    s, e, audio = self.chunker.out_q.get_nowait()
+                    s, e, audio, rms, peak = self.chunker.out_q.get_nowait()
                 except queue.Empty:
                     break
-                self.last_chunk = (s, e, audio)
+                self.last_chunk = (s, e, audio, rms, peak)
                 if self.autosend.get():
                     if self._last_auto_sent_s != s and self.q_jobs.qsize() < 4:
-                        self.q_jobs.put(("transcribe_remote", (s, e, audio, self.sr)))
+                        self.q_jobs.put(("transcribe_remote", (s, e, audio, self.sr, rms, peak)))
                         self._last_auto_sent_s = s
-            time.sleep(0.03)
         # flush on stop
+        self.chunker.emit_ready()
         self.chunker.flush()
-        while not self.chunker.out_q.empty():
+        while True:
             try: self.last_chunk = self.chunker.out_q.get_nowait()
             except queue.Empty: break
 
     def stop_live(self):
-        self.run_ev.clear()
+        # 先にストリームを止めてリングへの書き込みを確定させ、そのうえで
+        # _consumerを起こす（最終のemit/flushと書き込みが競合しない）
         try:
             if self.stream: self.stream.stop(); self.stream.close()
         except Exception:
             pass
         self.stream = None
+        self.run_ev.clear()
+        if self.chunker:
+            self.chunker.ready.set()  # 待機中の_consumerを起こして終了処理へ
         self.status.set("Stopped")
         self.btn_start.config(state=tk.NORMAL)
         self.btn_stop.config(state=tk.DISABLED)
 
     # --- Worker (server POST) ---
     def _start_worker(self):
-        def worker():
+        # エンコードとPOSTを2段パイプラインに分ける：
+        #   q_jobs →(encoder: ゲート+WAVエンコード)→ post_q →(poster: HTTP送信)
+        # 前のチャンクのネットワーク待ちの裏で次チャンクのエンコードが進む
+        self.post_q = queue.Queue(maxsize=4)
+
+        def encoder():
             while True:
                 kind, payload = self.q_jobs.get()
-                if kind == "transcribe_remote":
-                    s, e, audio, sr = payload
-                    # energy gate
-                    if audio.size == 0:
-                        self._append_text(s, e, "(empty chunk)"); continue
-                    rms  = float(np.sqrt(np.mean(audio**2)))
-                    peak = float(np.max(np.abs(audio)))
-                    # save for debug
-                    fname = SAVE_CHUNKS_DIR / f"chunk_{now_tag()}_{s:.2f}_{e:.2f}_r{rms:.6f}_p{peak:.6f}.wav"
+                if kind != "transcribe_remote":
+                    continue
+                # rms/peakはチャンク排出時に計算済み（ここでの再計算をやめた）
+                s, e, audio, sr, rms, peak = payload
+                if audio.size == 0:
+                    self._append_text(s, e, "(empty chunk)"); continue
+                # 無音ならエンコードもデバッグ保存もせずにここで落とす
+                if rms < ENERGY_RMS_GATE and peak < ENERGY_PEAK_GATE:
+                    self._append_text(s, e, f"(silence: rms={rms:.2e}, peak={peak:.2e})"); continue
+                if POST_FORMAT == "flac":
+                    bio = io.BytesIO()
+                    sf.write(bio, audio, sr, format="FLAC", subtype="PCM_16")
+                    bio.seek(0)
+                else:
+                    # WAVはヘッダ+生PCMを直接並べる（libsndfileのエンコードパス不要）
+                    bio = io.BytesIO(_wav_bytes(audio, sr))
+                if DEBUG_SAVE:
+                    fname = SAVE_CHUNKS_DIR / f"chunk_{next(self._dbg_idx):02d}.{POST_FORMAT}"
                     try:
-                        sf.write(fname, audio, sr, subtype="PCM_16")
+                        fname.write_bytes(bio.getvalue())
                     except Exception:
                         pass
-                    if rms < ENERGY_RMS_GATE and peak < ENERGY_PEAK_GATE:
-                        self._append_text(s, e, f"(silence: rms={rms:.2e}, peak={peak:.2e})"); continue
+                try:
+                    self.post_q.put((s, e, bio), timeout=1.0)
+                except queue.Full:
+                    self._append_text(s, e, "(dropped: post queue full)")
 
-                    url = self.server_var.get().strip() or SERVER_URL_DEFAULT
-                    # send file
+        def poster():
+            while True:
+                item = self.post_q.get()
+                # エンコード済みが溜まっていれば最大BATCH_MAX_FILES個まで
+                # 1リクエストに相乗りさせる（HTTP往復をN回→1回に圧縮）
+                batch = [item]
+                deadline = time.monotonic() + BATCH_COALESCE_S
+                while len(batch) < BATCH_MAX_FILES:
+                    remain = deadline - time.monotonic()
+                    if remain <= 0:
+                        break
                     try:
-                        t0 = time.perf_counter()
-                        with open(fname, "rb") as f:
-                            files = {"file": (fname.name, f, "audio/wav")}
-                            data = {}
-                            if FORCE_LANGUAGE:
-                                # only if your server supports; otherwise harmless
-                                data["language"] = FORCE_LANGUAGE
-                            r = requests.post(url, files=files, data=data, timeout=60)
-                        ms = (time.perf_counter() - t0) * 1000.0
-                        if r.ok:
-                            j = r.json()
-                            text = (j.get("text") or " ".join(seg.get("text", "") for seg in j.get("segments", []))).strip()
-                            text = text if text else "(no speech detected)"
-                            self._append_text(s, e, f"{text}")
-                            self.status.set(f"POST {int(ms)} ms OK")
-                        else:
-                            self._append_text(s, e, f"(server {r.status_code})")
-                            self.status.set(f"HTTP {r.status_code}")
-                    except Exception as ex:
-                        self._append_text(s, e, f"(error: {ex})")
-        threading.Thread(target=worker, daemon=True, name="PostWorker").start()
+                        batch.append(self.post_q.get(timeout=remain))
+                    except queue.Empty:
+                        break
+                parts = [("file", (f"chunk_{b[0]:.2f}.{POST_FORMAT}", b[2], POST_MIME)) for b in batch]
+                s, e = batch[0][0], batch[-1][1]
+
+                url = self.server_var.get().strip() or SERVER_URL_DEFAULT
+                # send buffers
+                try:
+                    t0 = time.perf_counter()
+                    data = {}
+                    if FORCE_LANGUAGE:
+                        # only if your server supports; otherwise harmless
+                        data["language"] = FORCE_LANGUAGE
+                    r = self.http.post(url, files=parts, data=data, timeout=60)
+                    ms = (time.perf_counter() - t0) * 1000.0
+                    if r.ok:
+                        j = r.json()
+                        text = (j.get("text") or " ".join(seg.get("text", "") for seg in j.get("segments", []))).strip()
+                        text = text if text else "(no speech detected)"
+                        self._append_text(s, e, f"{text}")
+                        self.status.set(f"POST {int(ms)} ms OK")
+                    else:
+                        self._append_text(s, e, f"(server {r.status_code})")
+                        self.status.set(f"HTTP {r.status_code}")
+                except Exception as ex:
+                    self._append_text(s, e, f"(error: {ex})")
+
+        threading.Thread(target=encoder, daemon=True, name="EncodeWorker").start()
+        # POST側は1本だと遅いレスポンス1回で後続が詰まるので複数本で重ねる
+        # （完了順は前後しうる＝表示順はPOST完了順）
+        for i in range(N_POST_WORKERS):
+            threading.Thread(target=poster, daemon=True, name=f"PostWorker-{i}").start()
 
     # --- Actions ---
     def send_last(self):
         if not self.last_chunk:
             messagebox.showinfo("Send", "まだチャンクがありません"); return
-        s, e, audio = self.last_chunk
+        s, e, audio, rms, peak = self.last_chunk
         if self.q_jobs.qsize() >= 6:
             messagebox.showinfo("Send", "処理中が多いためスキップしました"); return
-        self.q_jobs.put(("transcribe_remote", (s, e, audio, self.sr)))
+        self.q_jobs.put(("transcribe_remote", (s, e, audio, self.sr, rms, peak)))
         self.status.set(f"Queued chunk {s:.2f}-{e:.2f}s")
 
     def _append_text(self, s, e, text):
-        def apply():
-            self.txt.insert(tk.END, text + " ")
+        # チャンクごとにinsertせず溜めておき、100ms周期でまとめて反映する。
+        # 1チャンク=1行にしておくと下の行数上限の刈り込みがそのまま効く
+        self._pending_text.append(text + "\n")
+
+    def _drain_text(self):
+        if self._pending_text:
+            parts = []
+            while True:
+                try: parts.append(self._pending_text.popleft())
+                except IndexError: break
+            self.txt.insert(tk.END, "".join(parts))
+            # 行数上限を超えたら古い方からまとめて削除（Textの肥大化で
+            # insertのたびに全体リフローが走るのを防ぐ）
+            if int(self.txt.index("end-1c").split(".")[0]) > MAX_TEXT_LINES:
+                self.txt.delete("1.0", "100.0")
             self.txt.see(tk.END)
-        self.after(0, apply)
+        self.after(100, self._drain_text)
 
     # --- Level meter tick ---
     def _tick_level(self):
@@ -358,25 +559,19 @@ class App(tk.Tk):
         self.after(100, self._tick_level)
 
     # --- Ping helpers ---
-    def _post_wav_bytes(self, wav_path):
+    def _post_wav_buffer(self, name, bio):
         url = self.server_var.get().strip() or SERVER_URL_DEFAULT
-        with open(wav_path, "rb") as f:
-            files = {"file": (Path(wav_path).name, f, "audio/wav")}
-            data = {"language": FORCE_LANGUAGE} if FORCE_LANGUAGE else None
-            t0 = time.perf_counter()
-            r = requests.post(url, files=files, data=data, timeout=20)
-            ms = (time.perf_counter() - t0) * 1000.0
+        bio.seek(0)
+        files = {"file": (name, bio, "audio/wav")}
+        data = {"language": FORCE_LANGUAGE} if FORCE_LANGUAGE else None
+        t0 = time.perf_counter()
+        r = self.http.post(url, files=files, data=data, timeout=20)
+        ms = (time.perf_counter() - t0) * 1000.0
         return r, ms
 
     def ping_silent(self):
         try:
-            sr = 16000; dur = 0.5
-            x = np.zeros(int(sr*dur), dtype=np.float32)
-            tmp = OUTDIR / f"ping_silent_{now_tag()}.wav"
-            sf.write(tmp, x, sr, subtype="PCM_16")
-            r, ms = self._post_wav_bytes(tmp)
-            try: tmp.unlink(missing_ok=True)
-            except Exception: pass
+            r, ms = self._post_wav_buffer("ping_silent.wav", self._silent_wav)
             if r.ok:
                 j = r.json(); text = (j.get("text") or " ".join(seg.get("text", "") for seg in j.get("segments", []))).strip()
                 messagebox.showinfo("Ping", f"OK {ms:.1f} ms\ntext='{text[:60]}'")
@@ -387,13 +582,7 @@ class App(tk.Tk):
 
     def ping_sine(self):
         try:
-            sr = 16000; dur = 1.0; t = np.arange(int(sr*dur))/sr
-            x = 0.6*np.sin(2*np.pi*440*t).astype(np.float32)
-            tmp = OUTDIR / f"ping_sine_{now_tag()}.wav"
-            sf.write(tmp, x, sr, subtype="PCM_16")
-            r, ms = self._post_wav_bytes(tmp)
-            try: tmp.unlink(missing_ok=True)
-            except Exception: pass
+            r, ms = self._post_wav_buffer("ping_sine.wav", self._sine_wav)
             if r.ok:
                 j = r.json(); text = (j.get("text") or " ".join(seg.get("text", "") for seg in j.get("segments", []))).strip()
                 messagebox.showinfo("Ping", f"OK {ms:.1f} ms\ntext='{text[:60]}'")
@@ -4,7 +4,7 @@ from tkinter import ttk, messagebox
 import sounddevice as sd
 import soundfile as sf
 import numpy as np
-import time
+import threading
 from pathlib import Path
 import datetime as dt
 
@@ -29,14 +29,12 @@ def list_input_devices():
             })
     return out
 
-def try_open(device_index, sr, seconds=0.2):
-    """デバイスを指定SRで開けるか軽く試す（成功なら True）"""
+def try_open(device_index, sr):
+    """デバイスを指定SRで開けるか判定する（成功なら True）"""
+    # ストリームを実際に開いて0.2秒待つ代わりに設定チェックだけで判定する
+    # （デバイス×SR候補の総当たりが秒単位→ミリ秒になる）
     try:
-        stream = sd.InputStream(device=device_index, samplerate=int(sr), channels=1, dtype="float32", blocksize=0)
-        stream.start()
-        time.sleep(seconds)
-        stream.stop()
-        stream.close()
+        sd.check_input_settings(device=device_index, samplerate=int(sr), channels=1, dtype="float32")
         return True, ""
     except Exception as e:
         return False, str(e)
@@ -64,29 +62,36 @@ def auto_pick_device_and_sr(devices):
     return None, None, "どのデバイス/サンプルレートでも開けませんでした"
 
 def record_5s(device_index, sr):
-    """指定のデバイス/SRで5秒録音してWAV保存"""
-    sd.default.device = (device_index, None)
-    buf = []
-    def cb(indata, frames, time_info, status_):
-        if status_:
-            print("Status:", status_)
-        buf.append(indata.copy())
-
-    with sd.InputStream(device=device_index, samplerate=sr, channels=1, dtype="float32", blocksize=0, callback=cb):
-        t0 = time.perf_counter()
-        while time.perf_counter() - t0 < 5.0:
-            root.update()
-            time.sleep(0.01)
-
-    if not buf:
+    """指定のデバイス/SRで5秒録音してWAV保存（呼び出したスレッドをブロックする）"""
+    # sd.recは5秒分のバッファを最初に確保して直接書き込む
+    # （コールバックでリストに溜めて最後にconcatenateするコピーが不要）
+    data = sd.rec(int(5 * sr), samplerate=sr, channels=1, dtype="float32",
+                  device=device_index)
+    sd.wait()
+    data = data[:, 0]
+    if data.size == 0:
         raise RuntimeError("音声が取得できませんでした")
-
-    data = np.concatenate(buf, axis=0)[:, 0]
     out = OUTDIR / f"rec_{now_tag()}.wav"
     sf.write(out, data, sr, subtype="PCM_16")
     secs = len(data) / sr
     return out, secs
 
+def record_async(device_index, sr, make_msg):
+    """録音はワーカースレッドで行い、完了通知だけafterでTkスレッドへ戻す
+    （従来のroot.update()+sleepの100Hzポーリングでmainloopを止めない）"""
+    def work():
+        try:
+            out, secs = record_5s(device_index, sr)
+        except Exception as e:
+            # except変数はブロックを抜けると消えるので、文字列に固めてから渡す
+            msg = f"録音失敗: {e}"
+            root.after(0, lambda: (status.set("Ready"),
+                                   messagebox.showerror("Error", msg)))
+            return
+        root.after(0, lambda: (status.set(f"Saved {out.name} ({secs:.2f}s @ {sr} Hz)"),
+                               messagebox.showinfo("Done", make_msg(out, secs))))
+    threading.Thread(target=work, daemon=True).start()
+
 # ===== GUI =====
 root = tk.Tk()
 root.title("Step1: Auto-select & Record 5s")
@@ -110,14 +115,8 @@ def on_manual_record():
     dev = devices[i]
     sr = int(round(dev["default_sr"] or 16000))
     status.set(f"Manual: open [{dev['index']}] {dev['name']} @ {sr} Hz → 録音中…")
-    root.update_idletasks()
-    try:
-        out, secs = record_5s(dev["index"], sr)
-        status.set(f"Saved {out.name} ({secs:.2f}s @ {sr} Hz)")
-        messagebox.showinfo("Done", f"Saved:\n{out}\n{secs:.2f}s @ {sr} Hz")
-    except Exception as e:
-        status.set("Ready")
-        messagebox.showerror("Error", f"録音失敗: {e}")
+    record_async(dev["index"], sr,
+                 lambda out, secs: f"Saved:\n{out}\n{secs:.2f}s @ {sr} Hz")
 
 def on_auto_record():
     status.set("Auto: 入力デバイス/サンプルレートを探索中…")
@@ -132,14 +131,8 @@ def on_auto_record():
         return
     # 見つかった組合せで録音
     status.set(f"{reason} → 5秒録音中…")
-    root.update_idletasks()
-    try:
-        out, secs = record_5s(dev_index, sr)
-        status.set(f"Saved {out.name} ({secs:.2f}s @ {sr} Hz)")
-        messagebox.showinfo("Done", f"Auto selected:\nDevice #{dev_index}, {sr} Hz\n\nSaved:\n{out}\n{secs:.2f}s")
-    except Exception as e:
-        status.set("Ready")
-        messagebox.showerror("Error", f"録音失敗: {e}")
+    record_async(dev_index, sr,
+                 lambda out, secs: f"Auto selected:\nDevice #{dev_index}, {sr} Hz\n\nSaved:\n{out}\n{secs:.2f}s")
 
 ttk.Button(frame, text="🎙️ Auto 5秒録音 → WAV保存", command=on_auto_record).grid(row=1, column=0, columnspan=3, pady=(10, 6), sticky="ew")
 ttk.Button(frame, text="🎛️ Manual 5秒録音 → WAV保存", command=on_manual_record).grid(row=2, column=0, columnspan=3, pady=6, sticky="ew")